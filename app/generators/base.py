@@ -1,8 +1,34 @@
+import os
+from .prompts import build_prompt
+
 class BaseGenerator:
     """Base class for AI question generators.
     
     This abstract class defines the interface that all question generators must implement.
     """
+    def __init__(self):
+        self.current_category = os.getenv("TWITCH_CATEGORY", "Just Chatting")
+
+    def set_category(self, category: str):
+        """Update the current Twitch category.
+        
+        Args:
+            category: The new Twitch category name
+        """
+        self.current_category = category
+
+    def build_prompt(self, context: str, count: int = 1) -> str:
+        """Build the prompt for the current category within the token budget.
+        
+        Args:
+            context: The recent stream context.
+            count: Number of responses the prompt asks for.
+            
+        Returns:
+            The complete prompt as a string.
+        """
+        return build_prompt(self.current_category, context, count=count)
+
     def generate_question(self, context: str) -> str:
         """Generate a question based on the given context.
         
@@ -16,3 +42,18 @@ class BaseGenerator:
             NotImplementedError: If the method is not implemented by a subclass.
         """
         raise NotImplementedError("Subclasses must implement `generate_question`")
+
+    def generate_questions(self, context: str, count: int) -> list[str]:
+        """Generate several candidate questions in a single model call.
+        
+        Subclasses should override this; the default makes a single call and
+        returns one candidate.
+        
+        Args:
+            context: The context to generate questions from.
+            count: Number of candidates to request.
+            
+        Returns:
+            A list of up to `count` generated questions.
+        """
+        return [self.generate_question(context)]
@@ -1,6 +1,6 @@
 from ollama import Client
 from .base import BaseGenerator
-from .prompts import get_prompt_for_category
+from .prompts import parse_responses
 import os
 
 class OllamaGenerator(BaseGenerator):
@@ -10,18 +10,10 @@ class OllamaGenerator(BaseGenerator):
     simulating a curious Twitch viewer's perspective.
     """
     def __init__(self):
+        super().__init__()
         host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
         self.model = os.getenv("OLLAMA_MODEL", "llama3")
         self.client = Client(host=host)
-        self.current_category = os.getenv("TWITCH_CATEGORY", "Just Chatting")
-
-    def set_category(self, category: str):
-        """Update the current Twitch category.
-        
-        Args:
-            category: The new Twitch category name
-        """
-        self.current_category = category
 
     def generate_question(self, context: str) -> str:
         """Generate a question based on the stream context.
@@ -32,8 +24,24 @@ class OllamaGenerator(BaseGenerator):
         Returns:
             A generated question as a string.
         """
-        prompt_template = get_prompt_for_category(self.current_category)
-        prompt = prompt_template.format(context=context)
+        prompt = self.build_prompt(context)
         
         response = self.client.generate(model=self.model, prompt=prompt)
         return response['response'].strip()
+
+    def generate_questions(self, context: str, count: int) -> list[str]:
+        """Generate several candidate questions with a multi-answer prompt.
+        
+        Args:
+            context: The recent stream context to generate questions from.
+            count: Number of candidates to request.
+            
+        Returns:
+            A list of up to `count` generated questions.
+        """
+        if count <= 1:
+            return [self.generate_question(context)]
+        prompt = self.build_prompt(context, count=count)
+        
+        response = self.client.generate(model=self.model, prompt=prompt)
+        return parse_responses(response['response'], count)
@@ -9,6 +9,7 @@ class OpenAIGenerator(BaseGenerator):
     simulating a curious viewer's perspective.
     """
     def __init__(self):
+        super().__init__()
         self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
     def generate_question(self, context: str) -> str:
@@ -20,16 +21,33 @@ class OpenAIGenerator(BaseGenerator):
         Returns:
             A generated question as a string.
         """
-        prompt = f"""
-Act as a curious companion. Based on this recent text from the streamer, ask an interesting, funny, or deep question:
-
-\"{context.strip()}\"
-
-Question:
-"""
+        prompt = self.build_prompt(context)
         response = self.client.chat.completions.create(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.8
         )
         return response.choices[0].message.content.strip()
+
+    def generate_questions(self, context: str, count: int) -> list[str]:
+        """Generate several candidate questions as parallel completions.
+        
+        Args:
+            context: The recent stream context to generate questions from.
+            count: Number of candidates to request.
+            
+        Returns:
+            A list of up to `count` generated questions.
+        """
+        prompt = self.build_prompt(context)
+        response = self.client.chat.completions.create(
+            model="gpt-4",
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.8,
+            n=count
+        )
+        return [
+            choice.message.content.strip()
+            for choice in response.choices
+            if choice.message.content and choice.message.content.strip()
+        ]
@@ -1,11 +1,30 @@
-"""System prompts for different Twitch categories."""
+"""System prompts for different Twitch categories.
+
+Every generator builds its prompt through `build_prompt`, which resolves the
+category through the registry, reuses the compiled template and trims the
+oldest context lines until the prompt fits `PROMPT_TOKEN_BUDGET`.
+"""
+import difflib
+import logging
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "768"))
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "cl100k_base")
+FUZZY_MATCH_CUTOFF = 0.8
+CATEGORY_CACHE_SIZE = 256
 
 # Common instructions for all prompts
 BASE_INSTRUCTIONS = """
-You are a friendly and engaging Twitch chat participant. You should:
+You are a {persona}. You should:
 
-1. Engage in natural conversation about the current topic
-2. Keep the conversation focused on the streamer's interests
+1. {conversation}
+2. {focus}
 3. Use casual, friendly language
 4. Avoid making assumptions or confusing statements
 5. Show genuine interest in the streamer's experiences
@@ -15,7 +34,7 @@ You are a friendly and engaging Twitch chat participant. You should:
 9. Don't use emojis
 10. Don't use English words
 11. Don't use formal or technical language
-12. Use common Twitch chat language
+12. {chat_language}
 13. Mix questions with statements and reactions
 14. Keep responses short and natural, like a real chat message
 
@@ -28,107 +47,273 @@ Respond naturally to what was said. You can ask questions, make statements, or r
 Response:
 """
 
-GAMING_PROMPT = BASE_INSTRUCTIONS.replace(
-    "You are a friendly and engaging Twitch chat participant",
-    "You are a friendly and knowledgeable Twitch chat participant who loves gaming"
-).replace(
-    "Engage in natural conversation about the current topic",
-    "Engage in natural conversation about games, strategies, or the streamer's experience"
-).replace(
-    "Keep the conversation focused on the streamer's interests",
-    "Keep the conversation focused on gaming topics"
-).replace(
-    "Use common Twitch chat language",
-    "Use common Twitch chat and gaming community language"
+# Replaces the closing "Response:" line when several candidates are requested at once
+MULTI_RESPONSE_INSTRUCTIONS = """Write {count} different chat messages, one per line, without numbering or quotes.
+
+Responses:
+"""
+
+@dataclass(frozen=True)
+class CategoryStyle:
+    """Category-specific wording substituted into BASE_INSTRUCTIONS.
+
+    Attributes:
+        persona: Who the bot is in chat
+        conversation: What the bot talks about
+        focus: Which topics the conversation stays on
+        chat_language: Which community's chat language to use
+    """
+    persona: str
+    conversation: str
+    focus: str
+    chat_language: str
+
+@dataclass(frozen=True)
+class CompiledPrompt:
+    """A category prompt split around the context slot.
+
+    Attributes:
+        head: Text before the context
+        tail: Text after the context
+    """
+    head: str
+    tail: str
+
+    @property
+    def tokens(self) -> int:
+        """Token count of head and tail together.
+
+        Counted on first use rather than at import, since loading the
+        tokenizer may need to download its vocabulary.
+        """
+        return count_tokens(self.head) + count_tokens(self.tail)
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Load the tokenizer once, or None when tiktoken is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(PROMPT_TOKENIZER)
+    except Exception as e:
+        logger.warning(f"Tokenizer unavailable, estimating token counts: {e}")
+        return None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Count the tokens in a piece of text.
+
+    Results are cached because the same context lines are counted on every
+    generation while they stay in memory.
+
+    Args:
+        text: The text to count
+
+    Returns:
+        The token count, estimated at four characters per token without tiktoken
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+def _keep_last_tokens(text: str, max_tokens: int) -> str:
+    """Trim the start of a text so that at most `max_tokens` remain."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[-max_tokens * 4:]
+    tokens = encoding.encode(text)
+    return encoding.decode(tokens[-max_tokens:])
+
+def normalize_category(category: str) -> str:
+    """Normalise a category name for lookups.
+
+    Strips accents, case and anything that is not a letter or digit, so
+    "counter strike 2" and "Counter-Strike 2" resolve to the same entry.
+
+    Args:
+        category: The Twitch category name
+
+    Returns:
+        The normalised key
+    """
+    decomposed = unicodedata.normalize("NFKD", category)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]", "", stripped.casefold())
+
+class CategoryRegistry:
+    """Maps Twitch categories to compiled prompts.
+
+    Lookups try the normalised name first and fall back to the closest
+    registered name, then to the default prompt. Resolutions are cached by
+    normalised name in a bounded LRU cache.
+    """
+    def __init__(self, default: CategoryStyle):
+        self._default = self._compile(default)
+        self._prompts: dict[str, CompiledPrompt] = {}
+        self._lookup = lru_cache(maxsize=CATEGORY_CACHE_SIZE)(self._find)
+
+    @staticmethod
+    def _compile(style: CategoryStyle) -> CompiledPrompt:
+        head, tail = BASE_INSTRUCTIONS.split("{context}")
+        fields = dict(
+            persona=style.persona,
+            conversation=style.conversation,
+            focus=style.focus,
+            chat_language=style.chat_language,
+        )
+        head, tail = head.format(**fields), tail.format(**fields)
+        return CompiledPrompt(head=head, tail=tail)
+
+    def register(self, names: list[str], style: CategoryStyle):
+        """Register a style for one or more category names.
+
+        Args:
+            names: Twitch category names and aliases
+            style: The wording to use for these categories
+        """
+        compiled = self._compile(style)
+        for name in names:
+            self._prompts[normalize_category(name)] = compiled
+        self._lookup.cache_clear()
+
+    def resolve(self, category: str) -> CompiledPrompt:
+        """Find the compiled prompt for a category.
+
+        Args:
+            category: The Twitch category name
+
+        Returns:
+            The matching compiled prompt, or the default one
+        """
+        return self._lookup(normalize_category(category))
+
+    def _find(self, key: str) -> CompiledPrompt:
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            matches = difflib.get_close_matches(key, self._prompts.keys(), n=1, cutoff=FUZZY_MATCH_CUTOFF)
+            if matches:
+                logger.info(f"Category '{key}' fuzzy-matched to '{matches[0]}'")
+                prompt = self._prompts[matches[0]]
+            else:
+                logger.info(f"Category '{key}' not registered, using default prompt")
+                prompt = self._default
+        return prompt
+
+DEFAULT_STYLE = CategoryStyle(
+    persona="friendly and engaging Twitch chat participant",
+    conversation="Engage in natural conversation about the current topic",
+    focus="Keep the conversation focused on the streamer's interests",
+    chat_language="Use common Twitch chat language",
+)
+
+GAMING_STYLE = CategoryStyle(
+    persona="friendly and knowledgeable Twitch chat participant who loves gaming",
+    conversation="Engage in natural conversation about games, strategies, or the streamer's experience",
+    focus="Keep the conversation focused on gaming topics",
+    chat_language="Use common Twitch chat and gaming community language",
 )
 
-LEAGUE_OF_LEGENDS_PROMPT = BASE_INSTRUCTIONS.replace(
-    "You are a friendly and engaging Twitch chat participant",
-    "You are a friendly and knowledgeable Twitch chat participant who loves League of Legends"
-).replace(
-    "Engage in natural conversation about the current topic",
-    "Engage in natural conversation about LoL champions, strategies, meta, or the streamer's experience"
-).replace(
-    "Keep the conversation focused on the streamer's interests",
-    "Keep the conversation focused on League of Legends topics"
-).replace(
-    "Use common Twitch chat language",
-    "Use common Twitch chat and LoL community language"
+LEAGUE_OF_LEGENDS_STYLE = CategoryStyle(
+    persona="friendly and knowledgeable Twitch chat participant who loves League of Legends",
+    conversation="Engage in natural conversation about LoL champions, strategies, meta, or the streamer's experience",
+    focus="Keep the conversation focused on League of Legends topics",
+    chat_language="Use common Twitch chat and LoL community language",
 )
 
-JUST_CHATTING_PROMPT = BASE_INSTRUCTIONS.replace(
-    "You are a friendly and engaging Twitch chat participant",
-    "You are a friendly and engaging Twitch chat participant who enjoys casual conversation"
-).replace(
-    "Engage in natural conversation about the current topic",
-    "Engage in natural conversation about the current topic of discussion"
-).replace(
-    "Keep the conversation focused on the streamer's interests",
-    "Keep the conversation focused on the streamer's interests and experiences"
-).replace(
-    "Use common Twitch chat language",
-    "Use common Twitch chat and casual conversation language"
+JUST_CHATTING_STYLE = CategoryStyle(
+    persona="friendly and engaging Twitch chat participant who enjoys casual conversation",
+    conversation="Engage in natural conversation about the current topic of discussion",
+    focus="Keep the conversation focused on the streamer's interests and experiences",
+    chat_language="Use common Twitch chat and casual conversation language",
 )
 
-MUSIC_PROMPT = BASE_INSTRUCTIONS.replace(
-    "You are a friendly and engaging Twitch chat participant",
-    "You are a friendly and music-loving Twitch chat participant"
-).replace(
-    "Engage in natural conversation about the current topic",
-    "Engage in natural conversation about music, instruments, or the streamer's musical experience"
-).replace(
-    "Keep the conversation focused on the streamer's interests",
-    "Keep the conversation focused on musical topics"
-).replace(
-    "Use common Twitch chat language",
-    "Use common Twitch chat and music community language"
+MUSIC_STYLE = CategoryStyle(
+    persona="friendly and music-loving Twitch chat participant",
+    conversation="Engage in natural conversation about music, instruments, or the streamer's musical experience",
+    focus="Keep the conversation focused on musical topics",
+    chat_language="Use common Twitch chat and music community language",
 )
 
-ART_PROMPT = BASE_INSTRUCTIONS.replace(
-    "You are a friendly and engaging Twitch chat participant",
-    "You are a friendly and creative Twitch chat participant who loves art"
-).replace(
-    "Engage in natural conversation about the current topic",
-    "Engage in natural conversation about art, techniques, or the streamer's creative process"
-).replace(
-    "Keep the conversation focused on the streamer's interests",
-    "Keep the conversation focused on artistic topics"
-).replace(
-    "Use common Twitch chat language",
-    "Use common Twitch chat and art community language"
+ART_STYLE = CategoryStyle(
+    persona="friendly and creative Twitch chat participant who loves art",
+    conversation="Engage in natural conversation about art, techniques, or the streamer's creative process",
+    focus="Keep the conversation focused on artistic topics",
+    chat_language="Use common Twitch chat and art community language",
 )
 
-# Default prompt if category is not recognized
-DEFAULT_PROMPT = BASE_INSTRUCTIONS
-
-# Mapping of Twitch categories to their prompts
-CATEGORY_PROMPTS = {
-    "League of Legends": LEAGUE_OF_LEGENDS_PROMPT,
-    "Just Chatting": JUST_CHATTING_PROMPT,
-    "Music": MUSIC_PROMPT,
-    "Art": ART_PROMPT,
-    # Add more game categories to use the gaming prompt
-    "VALORANT": GAMING_PROMPT,
-    "Counter-Strike 2": GAMING_PROMPT,
-    "Minecraft": GAMING_PROMPT,
-    "Grand Theft Auto V": GAMING_PROMPT,
-    "Fortnite": GAMING_PROMPT,
-    "Apex Legends": GAMING_PROMPT,
-    "Dota 2": GAMING_PROMPT,
-    "World of Warcraft": GAMING_PROMPT,
-    "Overwatch 2": GAMING_PROMPT,
-    "Rocket League": GAMING_PROMPT,
-    "FIFA 24": GAMING_PROMPT,
-    "Call of Duty: Warzone": GAMING_PROMPT,
-}
-
-def get_prompt_for_category(category: str) -> str:
-    """Get the appropriate prompt for a given Twitch category.
-    
+# Default prompt is used if category is not recognized
+CATEGORY_REGISTRY = CategoryRegistry(DEFAULT_STYLE)
+CATEGORY_REGISTRY.register(["League of Legends", "LoL"], LEAGUE_OF_LEGENDS_STYLE)
+CATEGORY_REGISTRY.register(["Just Chatting"], JUST_CHATTING_STYLE)
+CATEGORY_REGISTRY.register(["Music"], MUSIC_STYLE)
+CATEGORY_REGISTRY.register(["Art"], ART_STYLE)
+# Add more game categories to use the gaming prompt
+CATEGORY_REGISTRY.register([
+    "VALORANT",
+    "Counter-Strike 2",
+    "Minecraft",
+    "Grand Theft Auto V",
+    "Fortnite",
+    "Apex Legends",
+    "Dota 2",
+    "World of Warcraft",
+    "Overwatch 2",
+    "Rocket League",
+    "FIFA 24",
+    "Call of Duty: Warzone",
+], GAMING_STYLE)
+
+def build_prompt(category: str, context: str, max_tokens: int = PROMPT_TOKEN_BUDGET,
+                 count: int = 1) -> str:
+    """Build the prompt for a category, trimming context to fit the token budget.
+
+    Whole context lines are dropped oldest first; if the newest line alone is
+    too long, its beginning is cut.
+
     Args:
         category: The Twitch category name
-        
+        context: Recent conversation, one message per line in chronological order
+        max_tokens: Maximum prompt length in tokens
+        count: Number of responses to ask for, one per line
+
+    Returns:
+        The complete prompt
+    """
+    prompt = CATEGORY_REGISTRY.resolve(category)
+    tail = prompt.tail
+    available = max_tokens - prompt.tokens
+    if count > 1:
+        tail = tail.replace("Response:\n", MULTI_RESPONSE_INSTRUCTIONS.format(count=count))
+        available = max_tokens - count_tokens(prompt.head) - count_tokens(tail)
+    kept: list[str] = []
+    for line in reversed([line for line in context.strip().splitlines() if line.strip()]):
+        cost = count_tokens(line) + 1  # Account for the newline
+        if cost > available:
+            if not kept:
+                kept.append(_keep_last_tokens(line, available - 1))
+            break
+        kept.append(line)
+        available -= cost
+    trimmed = "\n".join(reversed(kept))
+    if len(kept) < len(context.strip().splitlines()):
+        logger.debug(f"Trimmed prompt context to {len(kept)} lines to fit {max_tokens} tokens")
+    return prompt.head + trimmed + tail
+
+def parse_responses(text: str, count: int) -> list[str]:
+    """Split a multi-response completion into separate chat messages.
+
+    Args:
+        text: The raw model output
+        count: Maximum number of messages to return
+
     Returns:
-        The prompt template for the category, or the default prompt if category not found
+        Non-empty messages with numbering, bullets and quotes removed
     """
-    return CATEGORY_PROMPTS.get(category, DEFAULT_PROMPT) 
\ No newline at end of file
+    responses = []
+    for line in text.splitlines():
+        line = re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", line).strip().strip('"').strip()
+        if line:
+            responses.append(line)
+    return responses[:count]
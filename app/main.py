@@ -3,7 +3,9 @@ load_dotenv()
 
 import os
 import asyncio
+import json
 import logging
+import secrets
 
 # Configure logging
 logging.basicConfig(
@@ -12,10 +14,14 @@ logging.basicConfig(
     datefmt='%H:%M:%S'
 )
 
-from fastapi import FastAPI, WebSocket
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, WebSocket
+from fastapi.responses import PlainTextResponse, Response
 from app.config import settings
+from app.services.candidate_pool import CandidatePool
+from app.services.captions import caption_stream
 from app.services.chat_bot import TwitchChatSender
 from app.services.twitch_audio import TwitchAudioStreamer
+from app.tracing import export_chrome_trace, clear_trace, sample_profile
 from workers.transcriber import transcribe_worker
 from app.memory import add_to_memory, get_recent_context
 from app.generators.ollama_generator import OllamaGenerator
@@ -23,9 +29,11 @@ from app.generators.openai_generator import OpenAIGenerator
 
 logger = logging.getLogger(__name__)
 app = FastAPI()
-ws_clients: set[WebSocket] = set()
 
-chat_sender = TwitchChatSender()
+candidate_pool = CandidatePool()
+chat_sender = TwitchChatSender(candidate_pool)
+profile_lock = asyncio.Lock()
+MAX_PROFILE_SECONDS = 60
 
 def get_generator():
     provider = os.getenv("AI_PROVIDER", "ollama").lower()
@@ -40,18 +48,21 @@ def get_generator():
 generator = get_generator()
 
 class WSManager:
+    def __init__(self):
+        self.clients: set[WebSocket] = set()
+
     async def connect(self, ws: WebSocket):
         logger.info("WebSocket connection request received")
         await ws.accept()
-        ws_clients.add(ws)
-        logger.info(f"WebSocket connected, total clients: {len(ws_clients)}")
+        self.clients.add(ws)
+        logger.info(f"WebSocket connected, total clients: {len(self.clients)}")
 
     async def disconnect(self, ws: WebSocket):
-        ws_clients.remove(ws)
-        logger.info(f"WebSocket disconnected, total clients: {len(ws_clients)}")
+        self.clients.discard(ws)
+        logger.info(f"WebSocket disconnected, total clients: {len(self.clients)}")
 
     async def broadcast(self, msg: str):
-        for ws in list(ws_clients):
+        for ws in list(self.clients):
             try:
                 logger.debug(f"Broadcasting message: {msg}")
                 await ws.send_text(msg)
@@ -60,6 +71,7 @@ class WSManager:
                 await self.disconnect(ws)
 
 ws_manager = WSManager()
+captions_ws_manager = WSManager()
 
 @app.post("/set-category/{category}")
 async def set_category(category: str):
@@ -69,8 +81,7 @@ async def set_category(category: str):
         category: The new Twitch category name
     """
     logger.info(f"Setting category to: {category}")
-    if isinstance(generator, OllamaGenerator):
-        generator.set_category(category)
+    generator.set_category(category)
     return {"status": "success", "category": category}
 
 @app.on_event("startup")
@@ -97,8 +108,12 @@ async def startup():
     except Exception as e:
         logger.warning(f"Failed to start TwitchAudioStreamer: {e}")
 
+    # Initialize live captions
+    task_captions = asyncio.create_task(caption_stream.run(captions_ws_manager.broadcast))
+    logger.info(f"Caption stream task created: {task_captions}")
+
     # Initialize transcriber
-    task_worker = asyncio.create_task(transcribe_worker(queue, chat_sender))
+    task_worker = asyncio.create_task(transcribe_worker(queue, candidate_pool, generator, settings.twitch_channel, caption_stream))
     logger.info(f"Transcriber worker task created: {task_worker}")
 
     logger.info("Application startup complete")
@@ -112,6 +127,15 @@ async def questions_ws(ws: WebSocket):
     finally:
         await ws_manager.disconnect(ws)
 
+@app.websocket("/ws/captions")
+async def captions_ws(ws: WebSocket):
+    await captions_ws_manager.connect(ws)
+    try:
+        while True:
+            await ws.receive_text()
+    finally:
+        await captions_ws_manager.disconnect(ws)
+
 @app.on_event("shutdown")
 async def shutdown():
     logger.info("Shutting down application...")
@@ -122,3 +146,49 @@ async def shutdown():
 async def health_check():
     """Health check endpoint for monitoring."""
     return {"status": "healthy"}
+
+def require_debug_token(x_debug_token: str | None = Header(None)):
+    """Reject debug requests without the configured DEBUG_TOKEN.
+
+    Debug endpoints are hidden entirely when DEBUG_TOKEN is not set.
+    """
+    expected = os.getenv("DEBUG_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_debug_token or not secrets.compare_digest(x_debug_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+@app.get("/debug/trace", dependencies=[Depends(require_debug_token)])
+async def get_trace(clear: bool = False):
+    """Export recorded spans as Chrome trace-event JSON.
+    
+    Args:
+        clear: Drop the recorded spans after exporting them
+    """
+    trace = export_chrome_trace()
+    if clear:
+        clear_trace()
+    # A full buffer serialises to several megabytes, keep it off the event loop
+    body = await asyncio.to_thread(json.dumps, trace)
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"Content-Disposition": 'attachment; filename="trace.json"'}
+    )
+
+@app.post("/debug/profile", dependencies=[Depends(require_debug_token)])
+async def run_profile(seconds: float = Query(10.0, gt=0, le=MAX_PROFILE_SECONDS)):
+    """Sample the running process and return collapsed stacks for a flamegraph.
+    
+    Args:
+        seconds: How long to sample for
+    """
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with profile_lock:
+        logger.info(f"Starting {seconds}s sampling profile")
+        stacks = await asyncio.to_thread(sample_profile, seconds)
+    return PlainTextResponse(
+        stacks,
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'}
+    )
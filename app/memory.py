@@ -77,3 +77,17 @@ def get_recent_context() -> str:
     )
     logger.info(f"Generated context:\n{context}")
     return context
+
+def get_latest_message(speaker: str = "streamer") -> str:
+    """Get the most recent message from a speaker.
+    
+    Args:
+        speaker: Who said the message (user, streamer, or bot)
+        
+    Returns:
+        The message text, or an empty string if there is none in memory
+    """
+    for msg in reversed(messages):
+        if msg["speaker"] == speaker:
+            return msg["text"]
+    return ""
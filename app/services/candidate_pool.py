@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Candidate:
+    """A generated chat message waiting to be sent.
+
+    Attributes:
+        text: The message content
+        created_at: Monotonic time at which it was generated
+        correlation_id: Trace id of the window that produced it
+    """
+    text: str
+    created_at: float
+    correlation_id: str | None = None
+
+def _words(text: str) -> set[str]:
+    return {word for word in re.findall(r"\w+", text.casefold()) if len(word) > 3}
+
+class CandidatePool:
+    """A small pool of generated messages ranked by freshness and relevance.
+
+    Candidates expire after a TTL. When a message is taken, the pool picks the
+    one with the best score. The score combines exponential freshness decay
+    with word overlap against the latest thing the streamer said.
+    """
+    def __init__(self):
+        self.max_size = int(os.getenv("QUESTION_POOL_SIZE", "10"))
+        self.ttl = float(os.getenv("QUESTION_TTL_SECONDS", "60"))
+        self.half_life = self.ttl / 2
+        self.candidates: list[Candidate] = []
+        self.available = asyncio.Event()
+
+    def __len__(self) -> int:
+        self._prune()
+        return len(self.candidates)
+
+    def _prune(self):
+        now = time.monotonic()
+        fresh = [c for c in self.candidates if now - c.created_at < self.ttl]
+        if len(fresh) < len(self.candidates):
+            logger.debug(f"Dropped {len(self.candidates) - len(fresh)} expired candidates")
+        self.candidates = fresh
+
+    def add(self, texts: list[str], correlation_id: str | None = None):
+        """Add freshly generated messages to the pool.
+
+        Duplicates of messages already pooled are ignored. When the pool is
+        full, the oldest candidates are dropped.
+
+        Args:
+            texts: The generated messages
+            correlation_id: Trace id of the window that produced them
+        """
+        self._prune()
+        known = {c.text.casefold() for c in self.candidates}
+        now = time.monotonic()
+        for text in texts:
+            if text.casefold() in known:
+                continue
+            known.add(text.casefold())
+            self.candidates.append(Candidate(text, now, correlation_id))
+        self.candidates = self.candidates[-self.max_size:]
+        logger.info(f"Candidate pool size: {len(self.candidates)}")
+        if self.candidates:
+            self.available.set()
+
+    def score(self, candidate: Candidate, reference: set[str], now: float) -> float:
+        """Rank a candidate; higher is better.
+
+        Args:
+            candidate: The candidate to score
+            reference: Words of the latest streamer message
+            now: Current monotonic time
+
+        Returns:
+            Freshness in (0, 1] scaled by one plus the relevance overlap
+        """
+        freshness = 0.5 ** ((now - candidate.created_at) / self.half_life)
+        words = _words(candidate.text)
+        relevance = len(words & reference) / len(words) if words else 0.0
+        return freshness * (1 + relevance)
+
+    def pop_best(self, reference: str = "") -> Candidate | None:
+        """Remove and return the best unexpired candidate.
+
+        Args:
+            reference: The latest streamer message to rank relevance against
+
+        Returns:
+            The best candidate, or None if the pool is empty
+        """
+        self._prune()
+        if not self.candidates:
+            self.available.clear()
+            return None
+        now = time.monotonic()
+        reference_words = _words(reference)
+        best = max(self.candidates, key=lambda c: self.score(c, reference_words, now))
+        self.candidates.remove(best)
+        if not self.candidates:
+            self.available.clear()
+        return best
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+class CaptionStream:
+    """Publishes live caption deltas for WebSocket overlays.
+
+    Each audio window has one caption id. While the window is still filling,
+    ``partial`` messages carry a quick hypothesis of the audio so far; once the
+    window is transcribed a ``final`` message with the same id replaces it.
+    Events are queued without blocking so the transcriber never waits on slow
+    or missing clients.
+    """
+    def __init__(self, maxsize: int = 256):
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=maxsize)
+
+    def publish(self, kind: str, window_id: int, start: float, end: float, text: str):
+        """Queue a caption delta, dropping it if subscribers are lagging.
+
+        Must be called from the event loop thread.
+
+        Args:
+            kind: Either 'partial' or 'final'
+            window_id: Sequence number of the audio window, used as the caption id
+            start: Stream time in seconds at which the captioned audio starts
+            end: Stream time in seconds at which the captioned audio ends
+            text: The caption text
+        """
+        event = {
+            "type": kind,
+            "id": str(window_id),
+            "start": round(start, 2),
+            "end": round(end, 2),
+            "text": text.strip(),
+            "ts": time.time(),
+        }
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.debug(f"Caption queue full, dropping {kind} caption {window_id}")
+
+    async def run(self, broadcast: Callable[[str], Awaitable[None]]):
+        """Forward queued caption events to subscribers.
+
+        Args:
+            broadcast: Coroutine function sending a text message to all clients
+        """
+        logger.info("Caption stream started")
+        while True:
+            event = await self.queue.get()
+            try:
+                await broadcast(json.dumps(event, ensure_ascii=False))
+            except Exception as exc:
+                logger.error(f"Error broadcasting caption: {exc}")
+
+caption_stream = CaptionStream()
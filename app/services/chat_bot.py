@@ -3,6 +3,9 @@ import logging
 import os
 from aiohttp.client_exceptions import ClientConnectionResetError
 from twitchio import Client
+from app.memory import add_bot_question, get_latest_message
+from app.services.candidate_pool import CandidatePool
+from app.tracing import span, get_correlation_id, set_correlation_id
 
 logger = logging.getLogger(__name__)
 
@@ -10,8 +13,12 @@ class TwitchChatSender:
     """Asynchronous queue for Twitch IRC chat messages.
     
     Implements rate limiting for verified bots (20 messages per 30 seconds).
+    Messages queued with `send` go first; otherwise, as soon as the rate limit
+    has a free slot, the best candidate is taken from the candidate pool.
+    Pooled messages are paced by QUESTION_MIN_INTERVAL_SECONDS so the pool
+    holds a reserve to rank instead of being flushed in bursts.
     """
-    def __init__(self):
+    def __init__(self, pool: CandidatePool | None = None):
         self.token = os.getenv("TWITCH_BOT_TOKEN")
         self.channel = os.getenv("TWITCH_CHANNEL")  # without '#'
         logger.info(f"Initializing chat bot - token: {'set' if self.token else 'missing'}, channel: {self.channel}")
@@ -22,7 +29,11 @@ class TwitchChatSender:
             token=self.token,
             initial_channels=[f"#{self.channel}"]
         )
-        self.queue: asyncio.Queue[str] = asyncio.Queue()
+        self.queue: asyncio.Queue[tuple[str, str | None]] = asyncio.Queue()
+        self.pool = pool
+        self.min_interval = float(os.getenv("QUESTION_MIN_INTERVAL_SECONDS", "15"))
+        self._last_pooled = float("-inf")
+        self._queued = asyncio.Event()
         self._task: asyncio.Task | None = None
 
     async def start(self):
@@ -47,7 +58,40 @@ class TwitchChatSender:
 
     async def send(self, message: str):
         logger.debug(f"Enqueueing message: {message}")
-        await self.queue.put(message)
+        # Carry the producer's correlation id so send spans line up with its window
+        await self.queue.put((message, get_correlation_id()))
+        self._queued.set()
+
+    async def _next_message(self) -> tuple[str, str | None, bool]:
+        """Wait for the next message to send.
+
+        Returns:
+            Tuple of (message, correlation id, whether it came from the pool)
+        """
+        while True:
+            if not self.queue.empty():
+                msg, correlation_id = self.queue.get_nowait()
+                return msg, correlation_id, False
+            timeout = None
+            if self.pool is not None:
+                now = asyncio.get_event_loop().time()
+                remaining = self._last_pooled + self.min_interval - now
+                if remaining <= 0:
+                    candidate = self.pool.pop_best(get_latest_message("streamer"))
+                    if candidate:
+                        self._last_pooled = now
+                        return candidate.text, candidate.correlation_id, True
+                else:
+                    timeout = remaining
+            self._queued.clear()
+            waiters = [asyncio.create_task(self._queued.wait())]
+            if self.pool is not None and timeout is None:
+                waiters.append(asyncio.create_task(self.pool.available.wait()))
+            try:
+                await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
 
     async def _consumer(self):
         logger.info("Consumer started")
@@ -61,18 +105,25 @@ class TwitchChatSender:
 
         logger.info(f"Connected to channels: {self.client.connected_channels}")
         while True:
-            msg = await self.queue.get()
-            logger.debug(f"Processing message from queue: {msg}")
             try:
+                # Wait for a free slot first so the freshest candidate is picked at send time
+                wait = 0.0
                 now = asyncio.get_event_loop().time()
                 bucket = [t for t in bucket if now - t < WINDOW]
                 if len(bucket) >= RATE:
                     wait = WINDOW - (now - bucket[0])
                     logger.info(f"Rate limit reached, sleeping {wait}s")
                     await asyncio.sleep(wait)
+                    now = asyncio.get_event_loop().time()
                     bucket = [t for t in bucket if now - t < WINDOW]
+                msg, correlation_id, from_pool = await self._next_message()
+                # The message is only known after the wait, so its span carries the wait time
+                set_correlation_id(correlation_id)
                 logger.debug(f"Sending to channel #{self.channel}: {msg}")
-                await self.client.connected_channels[0].send(msg)
+                with span("chat.send", rate_limit_wait_s=round(wait, 3)):
+                    await self.client.connected_channels[0].send(msg)
                 bucket.append(asyncio.get_event_loop().time())
+                if from_pool:
+                    add_bot_question(msg)
             except Exception as exc:
                 logger.error(f"Error sending message to chat: {exc}")
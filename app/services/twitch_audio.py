@@ -2,6 +2,7 @@ import asyncio
 import logging
 import streamlink
 from dotenv import load_dotenv
+from app.tracing import span
 
 load_dotenv()
 
@@ -72,7 +73,8 @@ class TwitchAudioStreamer:
             # Read audio data
             while True:
                 try:
-                    data = await self.proc.stdout.read(4096)
+                    with span("ffmpeg.read"):
+                        data = await self.proc.stdout.read(4096)
                     if not data:
                         logger.warning("No more data from FFmpeg, exiting loop")
                         break
@@ -0,0 +1,175 @@
+"""Lightweight span tracing and sampling profiler for the hot path.
+
+Spans are recorded as Chrome trace events (load the export in
+chrome://tracing or https://ui.perfetto.dev). Spans recorded inside an
+asyncio task get a track per task, since complete events on one track must
+nest and concurrent tasks share the event-loop thread. When tracing is disabled
+``span`` returns a shared no-op context manager, so instrumented code pays
+only for a function call.
+"""
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "20000"))  # Oldest events are dropped first
+
+_events: deque[dict] = deque(maxlen=TRACE_MAX_EVENTS)
+_track_ids = itertools.count(1)
+_task_tracks: weakref.WeakKeyDictionary[asyncio.Task, int] = weakref.WeakKeyDictionary()
+_thread_tracks: dict[int, int] = {}
+_track_names: dict[int, str] = {}
+_correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+_NOOP_SPAN = contextlib.nullcontext()
+_PID = os.getpid()
+
+def _new_track(name: str) -> int:
+    """Allocate a track id that is never reused, unlike task ids and thread idents."""
+    if len(_track_names) >= TRACE_MAX_EVENTS:
+        # Forget tracks whose events have all been dropped from the buffer
+        used = {event["tid"] for event in list(_events)}
+        for track in [track for track in _track_names if track not in used]:
+            del _track_names[track]
+    track = next(_track_ids)
+    _track_names[track] = name
+    return track
+
+def _current_track() -> int:
+    """Get the trace track of the caller: its asyncio task, else its thread."""
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is None:
+        ident = threading.get_ident()
+        track = _thread_tracks.get(ident)
+        if track is None:
+            track = _thread_tracks[ident] = _new_track(threading.current_thread().name)
+    else:
+        track = _task_tracks.get(task)
+        if track is None:
+            track = _task_tracks[task] = _new_track(f"task {task.get_name()}")
+    return track
+
+class _Span:
+    """Context manager recording a single complete ('X') trace event."""
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        args = self.args
+        args["correlation_id"] = _correlation_id.get()
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        _events.append({
+            "name": self.name,
+            "cat": "stream-npc",
+            "ph": "X",
+            "ts": self.start / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": _PID,
+            "tid": _current_track(),
+            "args": args,
+        })
+        return False
+
+def span(name: str, **args):
+    """Trace the enclosed block as a named span.
+
+    Args:
+        name: Span name shown in the trace viewer
+        **args: Extra attributes attached to the event
+
+    Returns:
+        A context manager; a shared no-op one when tracing is disabled
+    """
+    if not TRACE_ENABLED:
+        return _NOOP_SPAN
+    return _Span(name, args)
+
+def set_correlation_id(correlation_id: str | None):
+    """Set the id attached to spans recorded in the current context.
+
+    The id follows ``asyncio.to_thread`` calls and tasks created afterwards.
+
+    Args:
+        correlation_id: Window or message id, or None to clear it
+    """
+    _correlation_id.set(correlation_id)
+
+def get_correlation_id() -> str | None:
+    """Get the correlation id of the current context."""
+    return _correlation_id.get()
+
+def export_chrome_trace() -> dict:
+    """Export recorded spans in Chrome trace-event JSON format.
+
+    Returns:
+        A dict ready to be serialised as a trace file
+    """
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": _PID, "tid": track, "args": {"name": name}}
+        for track, name in list(_track_names.items())
+    ]
+    return {"traceEvents": metadata + list(_events), "displayTimeUnit": "ms"}
+
+def clear_trace():
+    """Drop all recorded spans."""
+    _events.clear()
+    _task_tracks.clear()
+    _thread_tracks.clear()
+    _track_names.clear()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_profile(seconds: float, interval: float = 0.005) -> str:
+    """Sample the stacks of all running threads for a fixed duration.
+
+    Blocks the calling thread, so run it with ``asyncio.to_thread``.
+
+    Args:
+        seconds: How long to sample for
+        interval: Delay between samples in seconds
+
+    Returns:
+        Collapsed stacks (one ``frame;frame;... count`` line per stack),
+        the input format of flamegraph.pl and speedscope
+    """
+    logger.info(f"Sampling profile for {seconds}s every {interval * 1000:.1f}ms")
+    own_thread = threading.get_ident()
+    stacks: Counter[str] = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(thread_id, str(thread_id)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    logger.info(f"Profile finished with {sum(stacks.values())} samples")
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
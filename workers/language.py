@@ -0,0 +1,171 @@
+import logging
+import math
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary hints passed to Whisper as initial_prompt for each language
+LANGUAGE_PROMPTS = {
+    "es": "League of Legends, videojuegos, gaming, streamer, partida, chat",
+    "en": "League of Legends, video games, gaming, streamer, match, chat",
+    "pt": "League of Legends, videogames, jogos, streamer, partida, chat",
+    "fr": "League of Legends, jeux vidéo, gaming, streamer, partie, chat",
+    "de": "League of Legends, Videospiele, Gaming, Streamer, Match, Chat",
+    "it": "League of Legends, videogiochi, gaming, streamer, partita, chat",
+}
+
+@dataclass
+class LanguageState:
+    """Detected language of a channel.
+
+    Attributes:
+        language: Whisper language code
+        probability: Detection probability reported by Whisper, 0 for the fallback
+        next_detection_at: Monotonic time after which detection runs again
+        low_confidence_windows: Consecutive windows transcribed with low confidence
+    """
+    language: str
+    probability: float
+    next_detection_at: float
+    low_confidence_windows: int = 0
+
+class LanguageCache:
+    """Caches the spoken language per channel so detection runs rarely.
+
+    The first window with speech is transcribed with auto-detection and the
+    result is reused for later windows. Detection runs again after
+    `redetect_seconds` or after several consecutive low-confidence windows,
+    which usually means the streamer switched language. A detection that is
+    not confident keeps the previous language and is retried after
+    `retry_seconds`; without a previous language, `default_language` is used
+    once `max_detection_attempts` detections in a row have failed.
+    """
+    def __init__(self, redetect_seconds: float = 600, retry_seconds: float = 60,
+                 min_probability: float = 0.5, min_confidence: float = 0.5,
+                 max_low_confidence_windows: int = 3, max_detection_attempts: int = 3,
+                 forced_language: str | None = None, default_language: str | None = None,
+                 initial_prompt: str | None = None):
+        self.redetect_seconds = redetect_seconds
+        self.retry_seconds = retry_seconds
+        self.min_probability = min_probability
+        self.min_confidence = min_confidence
+        self.max_low_confidence_windows = max_low_confidence_windows
+        self.max_detection_attempts = max_detection_attempts
+        self.forced_language = forced_language
+        self.default_language = default_language
+        self.initial_prompt = initial_prompt
+        self._states: dict[str, LanguageState] = {}
+        self._failed_detections: dict[str, int] = {}
+
+    def language_for(self, channel: str) -> str | None:
+        """Get the language to transcribe the next window with.
+
+        Args:
+            channel: The Twitch channel name
+
+        Returns:
+            A language code, or None when Whisper should detect it
+        """
+        if self.forced_language:
+            return self.forced_language
+        state = self._states.get(channel)
+        if state is None:
+            return None
+        if time.monotonic() >= state.next_detection_at:
+            logger.debug(f"Cached language for {channel} is due for detection")
+            return None
+        if state.low_confidence_windows >= self.max_low_confidence_windows:
+            logger.debug(f"Low transcription confidence for {channel}, detecting language")
+            return None
+        return state.language
+
+    def last_language(self, channel: str) -> str | None:
+        """Get the last known language without ever asking for detection.
+
+        Args:
+            channel: The Twitch channel name
+
+        Returns:
+            The forced or cached language, or None if none is known yet
+        """
+        if self.forced_language:
+            return self.forced_language
+        state = self._states.get(channel)
+        return state.language if state else None
+
+    def detect_with_best_model(self, channel: str) -> bool:
+        """Whether the next detection should use the most accurate model.
+
+        After `max_detection_attempts` failed detections in a row, detection
+        falls back to the current quality level so it stops bypassing the
+        quality controller.
+
+        Args:
+            channel: The Twitch channel name
+        """
+        return self._failed_detections.get(channel, 0) < self.max_detection_attempts
+
+    def initial_prompt_for(self, language: str | None) -> str | None:
+        """Get the Whisper initial_prompt for a language.
+
+        Args:
+            language: A language code, or None while detecting
+
+        Returns:
+            The configured prompt if set, otherwise the language's vocabulary hints
+        """
+        if self.initial_prompt:
+            return self.initial_prompt
+        return LANGUAGE_PROMPTS.get(language)
+
+    def record(self, channel: str, language: str | None, info, segments: list,
+               best_quality: bool = True):
+        """Update the cache with the outcome of a transcribed window.
+
+        Args:
+            channel: The Twitch channel name
+            language: The language passed to Whisper, None if it was detected
+            info: Whisper transcription info
+            segments: Decoded segments of the window
+            best_quality: Whether the window was decoded with the most accurate
+                level; confidence from smaller levels is not held against the language
+        """
+        if self.forced_language or not segments:
+            # Wait for actual speech before trusting a detection
+            return
+        state = self._states.get(channel)
+        now = time.monotonic()
+        if language is None:
+            detected = getattr(info, "language", None)
+            probability = getattr(info, "language_probability", 0.0)
+            if detected and probability >= self.min_probability:
+                logger.info(f"Detected language for {channel}: {detected} ({probability:.2f})")
+                self._states[channel] = LanguageState(detected, probability, now + self.redetect_seconds)
+                self._failed_detections.pop(channel, None)
+                return
+            failures = self._failed_detections.get(channel, 0) + 1
+            self._failed_detections[channel] = failures
+            if state is not None:
+                logger.info(
+                    f"Language detection for {channel} not confident ({detected}, {probability:.2f}), "
+                    f"keeping {state.language} and retrying in {self.retry_seconds:.0f}s"
+                )
+                state.next_detection_at = now + self.retry_seconds
+                state.low_confidence_windows = 0
+            elif failures >= self.max_detection_attempts and self.default_language:
+                logger.info(
+                    f"Language detection for {channel} failed {failures} times, "
+                    f"using {self.default_language} and retrying in {self.retry_seconds:.0f}s"
+                )
+                self._states[channel] = LanguageState(self.default_language, 0.0, now + self.retry_seconds)
+            return
+        if state is None or not best_quality:
+            return
+        confidence = sum(math.exp(seg.avg_logprob) for seg in segments) / len(segments)
+        if confidence < self.min_confidence:
+            state.low_confidence_windows += 1
+            if state.low_confidence_windows == self.max_low_confidence_windows:
+                logger.info(f"Low transcription confidence for {channel}, detecting language again")
+        else:
+            state.low_confidence_windows = 0
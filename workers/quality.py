@@ -0,0 +1,139 @@
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class QualityLevel:
+    """A Whisper decoding configuration.
+
+    Attributes:
+        model_name: Name of a preloaded Whisper model
+        beam_size: Beam size for decoding
+        best_of: Number of candidates when sampling
+    """
+    model_name: str
+    beam_size: int
+    best_of: int
+
+def build_levels(model_names: list[str], beam_size: int, best_of: int) -> list[QualityLevel]:
+    """Build the quality ladder from the fastest to the most accurate level.
+
+    Each model gets a greedy level and, if a wider beam is configured, a beam
+    search level, so the controller gives up beam width before model size.
+
+    Args:
+        model_names: Whisper models ordered from fastest to most accurate
+        beam_size: Beam size of the best level
+        best_of: Candidates of the best level
+
+    Returns:
+        The quality levels in ascending order
+    """
+    levels = []
+    for name in model_names:
+        levels.append(QualityLevel(name, 1, 1))
+        if beam_size > 1 or best_of > 1:
+            levels.append(QualityLevel(name, beam_size, best_of))
+    return levels
+
+class QualityController:
+    """Adapts Whisper quality to keep transcription faster than real time.
+
+    Tracks a smoothed real-time factor (processing time / audio time) per
+    window. Above the budget it steps down one level; after several windows
+    well under the budget it steps back up. All models are loaded up front
+    so switching level is free.
+    """
+    def __init__(self, models: dict, levels: list[QualityLevel], rtf_budget: float = 0.5,
+                 headroom: float = 0.5, upgrade_after: int = 3, smoothing: float = 0.5):
+        self.models = models
+        self.levels = levels
+        self.rtf_budget = rtf_budget
+        self.headroom = headroom
+        self.upgrade_after = upgrade_after
+        self.smoothing = smoothing
+        self.index = len(levels) - 1
+        self.rtf: float | None = None
+        self._fast_windows = 0
+
+    @property
+    def level(self) -> QualityLevel:
+        """The level to decode the next window with."""
+        return self.levels[self.index]
+
+    @property
+    def fastest_level(self) -> QualityLevel:
+        """The cheapest level available."""
+        return self.levels[0]
+
+    @property
+    def best_level(self) -> QualityLevel:
+        """The most accurate level available."""
+        return self.levels[-1]
+
+    def has_headroom(self) -> bool:
+        """Whether decoding runs at the best level and within budget."""
+        return (
+            self.index == len(self.levels) - 1
+            and (self.rtf is None or self.rtf <= self.rtf_budget)
+        )
+
+    def model_for(self, level: QualityLevel):
+        """Get the preloaded Whisper model for a level."""
+        return self.models[level.model_name]
+
+    def redecode_budget(self, level: QualityLevel, audio_seconds: float, decode_seconds: float) -> float:
+        """Time left for re-decoding a window with the best model.
+
+        Re-decoding is not recorded as part of the real-time factor, so it is
+        limited to what the window's decode left unused of the budget.
+
+        Args:
+            level: Level the window was decoded with
+            audio_seconds: Duration of the audio in the window
+            decode_seconds: Time spent on the window's main decode
+
+        Returns:
+            Seconds available for re-decoding, 0 if there is no better model or no time
+        """
+        if level.model_name == self.best_level.model_name:
+            return 0.0
+        return max(0.0, self.rtf_budget * audio_seconds - decode_seconds)
+
+    def record(self, audio_seconds: float, processing_seconds: float):
+        """Record a processed window and adjust the level if needed.
+
+        Args:
+            audio_seconds: Duration of the audio in the window
+            processing_seconds: Time spent on the window's main decode
+        """
+        if audio_seconds <= 0:
+            return
+        ratio = processing_seconds / audio_seconds
+        if self.rtf is None:
+            self.rtf = ratio
+        else:
+            self.rtf = self.smoothing * ratio + (1 - self.smoothing) * self.rtf
+        logger.debug(f"Real-time factor {ratio:.2f} (smoothed {self.rtf:.2f}) at {self.level}")
+
+        if self.rtf > self.rtf_budget:
+            self._fast_windows = 0
+            if self.index > 0:
+                self._switch(self.index - 1)
+        elif self.rtf < self.rtf_budget * self.headroom:
+            self._fast_windows += 1
+            if self._fast_windows >= self.upgrade_after and self.index < len(self.levels) - 1:
+                self._switch(self.index + 1)
+        else:
+            self._fast_windows = 0
+
+    def _switch(self, index: int):
+        logger.info(
+            f"Real-time factor {self.rtf:.2f} against budget {self.rtf_budget:.2f}, "
+            f"switching Whisper from {self.level} to {self.levels[index]}"
+        )
+        self.index = index
+        # Measure the new level from scratch
+        self.rtf = None
+        self._fast_windows = 0
@@ -1,13 +1,18 @@
 import asyncio
 import logging
+import math
 import os
 import io
+import time
 import wave
 from faster_whisper import WhisperModel
-from app.memory import add_to_memory, get_recent_context, add_bot_question
-from app.services.chat_bot import TwitchChatSender
-from app.generators.ollama_generator import OllamaGenerator
-from app.generators.openai_generator import OpenAIGenerator
+from app.memory import add_to_memory, get_recent_context
+from app.services.candidate_pool import CandidatePool
+from app.services.captions import CaptionStream
+from app.tracing import span, set_correlation_id
+from app.generators.base import BaseGenerator
+from workers.language import LanguageCache
+from workers.quality import QualityController, QualityLevel, build_levels
 
 logger = logging.getLogger(__name__)
 logger.info("Transcriber module loaded")
@@ -20,31 +25,113 @@ BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))  # Default to 1 for faster
 BEST_OF = int(os.getenv("WHISPER_BEST_OF", "1"))  # Default to 1 for faster processing
 TEMPERATURE = float(os.getenv("WHISPER_TEMPERATURE", "0.0"))
 CONDITION_ON_PREVIOUS = os.getenv("WHISPER_CONDITION_PREVIOUS", "false").lower() == "true"
-INITIAL_PROMPT = os.getenv("WHISPER_INITIAL_PROMPT", "League of Legends, video games, gaming, streamer")
+INITIAL_PROMPT = os.getenv("WHISPER_INITIAL_PROMPT")  # Overrides the per-language vocabulary hints
+LANGUAGE = os.getenv("WHISPER_LANGUAGE")  # Skip detection and always use this language
+LANGUAGE_REDETECT_SECONDS = float(os.getenv("WHISPER_LANGUAGE_REDETECT_SECONDS", "600"))
+LANGUAGE_RETRY_SECONDS = float(os.getenv("WHISPER_LANGUAGE_RETRY_SECONDS", "60"))
+DEFAULT_LANGUAGE = os.getenv("WHISPER_DEFAULT_LANGUAGE")  # Used when detection keeps failing
+CAPTION_PARTIAL_INTERVAL_MS = int(os.getenv("CAPTION_PARTIAL_INTERVAL_MS", "1000"))  # 0 disables partial captions
+CAPTION_PARTIAL_SECONDS = float(os.getenv("CAPTION_PARTIAL_SECONDS", "4"))  # Newest audio decoded per partial
+QUESTION_BATCH_SIZE = int(os.getenv("QUESTION_BATCH_SIZE", "3"))  # Candidates generated per LLM call
+MIN_CONFIDENCE = float(os.getenv("WHISPER_MIN_CONFIDENCE", "0.5"))
 
-provider = os.getenv("AI_PROVIDER", "ollama")
-logger.info(f"Using AI provider: {provider}")
-if provider == "openai":
-    generator = OpenAIGenerator()
-else:
-    generator = OllamaGenerator()
+# Adaptive quality: models ordered from fastest to most accurate, WHISPER_MODEL is the best one
+ADAPTIVE = os.getenv("WHISPER_ADAPTIVE", "true").lower() == "true"
+DEFAULT_LADDER = WHISPER_MODEL if WHISPER_MODEL == "tiny" else f"tiny,{WHISPER_MODEL}"
+MODEL_LADDER = [
+    name.strip() for name in os.getenv("WHISPER_MODEL_LADDER", DEFAULT_LADDER).split(",") if name.strip()
+] if ADAPTIVE else [WHISPER_MODEL]
+RTF_BUDGET = float(os.getenv("WHISPER_RTF_BUDGET", "0.5"))  # Max processing time per second of audio
+REDECODE_LOW_CONFIDENCE = os.getenv("WHISPER_REDECODE_LOW_CONFIDENCE", "false").lower() == "true"
 
-# Initialize Whisper with configured settings
-model = WhisperModel(
-    WHISPER_MODEL,
-    device=DEVICE,
-    compute_type="int8" if not USE_CUDA else "float16"  # Use int8 for CPU, float16 for GPU
+# Preload every model on the ladder so switching level is instant
+models = {}
+for name in MODEL_LADDER:
+    models[name] = WhisperModel(
+        name,
+        device=DEVICE,
+        compute_type="int8" if not USE_CUDA else "float16"  # Use int8 for CPU, float16 for GPU
+    )
+    logger.info(f"WhisperModel loaded: {name} on {DEVICE}")
+
+levels = build_levels(MODEL_LADDER, BEAM_SIZE, BEST_OF)
+if not ADAPTIVE:
+    levels = levels[-1:]
+quality = QualityController(models, levels, rtf_budget=RTF_BUDGET)
+languages = LanguageCache(
+    redetect_seconds=LANGUAGE_REDETECT_SECONDS,
+    retry_seconds=LANGUAGE_RETRY_SECONDS,
+    min_confidence=MIN_CONFIDENCE,
+    forced_language=LANGUAGE,
+    default_language=DEFAULT_LANGUAGE,
+    initial_prompt=INITIAL_PROMPT
 )
-logger.info(f"WhisperModel loaded: {WHISPER_MODEL} on {DEVICE}")
 
-async def transcribe_worker(queue: asyncio.Queue, chat_sender: TwitchChatSender):
+async def transcribe_worker(queue: asyncio.Queue, candidate_pool: CandidatePool,
+                            generator: BaseGenerator, channel: str,
+                            captions: CaptionStream | None = None):
     logger.info("Starting transcriber worker")
     buffer = b""
+    buffer_start = 0.0  # Stream time in seconds of the first byte in buffer
+    window_id = 0
     window_ms = 15000  # Increased to 15 seconds
     overlap_ms = 5000  # 5 second overlap
     last_emit = asyncio.get_running_loop().time()
     min_buffer_size = 16000 * 2 * 5  # Minimum 5 seconds of audio (16kHz, 16-bit)
 
+    asr_lock = asyncio.Lock()  # Keeps partial caption decodes off the window decode
+
+    async def publish_partials():
+        """Caption the window still being filled with the fastest model.
+
+        Runs beside the main loop and decodes the newest CAPTION_PARTIAL_SECONDS
+        of audio each time CAPTION_PARTIAL_INTERVAL_MS of new audio arrives.
+        Partials are skipped while a window is being decoded and whenever the
+        quality controller has no headroom, so they never slow the window
+        decode, which stays the only source of final captions.
+        """
+        partial_bytes = CAPTION_PARTIAL_INTERVAL_MS * 16000 * 2 // 1000
+        tail_bytes = int(CAPTION_PARTIAL_SECONDS * 16000) * 2
+        decoded_window, decoded_bytes = 0, 0
+        while True:
+            await asyncio.sleep(CAPTION_PARTIAL_INTERVAL_MS / 1000)
+            try:
+                snapshot, start, pending_window = buffer, buffer_start, window_id + 1
+                if pending_window != decoded_window:
+                    decoded_window, decoded_bytes = pending_window, 0
+                if len(snapshot) - decoded_bytes < partial_bytes:
+                    continue
+                if asr_lock.locked() or not quality.has_headroom():
+                    continue
+                decoded_bytes = len(snapshot)
+                # Never pay for detection on partials, wait for a known language
+                language = languages.last_language(channel)
+                if language is None:
+                    continue
+                tail = snapshot[-tail_bytes:]
+                tail_start = start + (len(snapshot) - len(tail)) / (16000 * 2)
+                async with asr_lock:
+                    segments, _ = await asyncio.to_thread(
+                        transcribe_wav_bytes, tail, quality.fastest_level,
+                        language, languages.initial_prompt_for(language)
+                    )
+                if window_id + 1 != pending_window:
+                    # The window was committed while decoding, its final is already out
+                    continue
+                text = " ".join(seg.text.strip() for seg in segments)
+                if text:
+                    captions.publish("partial", pending_window, tail_start, start + len(snapshot) / (16000 * 2), text)
+            except Exception as e:
+                logger.error(f"Error publishing partial captions: {str(e)}", exc_info=True)
+
+    if captions and CAPTION_PARTIAL_INTERVAL_MS > 0:
+        if quality.fastest_level.model_name == quality.best_level.model_name:
+            logger.info("No smaller Whisper model loaded, partial captions disabled")
+        else:
+            partial_task = asyncio.create_task(publish_partials())
+            # Stop captioning when the worker exits or is cancelled
+            asyncio.current_task().add_done_callback(lambda _: partial_task.cancel())
+
     while True:
         try:
             # Wait for data in queue
@@ -66,11 +153,47 @@ async def transcribe_worker(queue: asyncio.Queue, chat_sender: TwitchChatSender)
                 overlap_bytes = int(overlap_ms * 16000 * 2 / 1000)  # Convert ms to bytes
                 current_buffer = buffer[:-overlap_bytes] if len(buffer) > overlap_bytes else buffer
                 buffer = buffer[-overlap_bytes:] if len(buffer) > overlap_bytes else b""
+                window_id += 1
+                window_start = buffer_start
+                set_correlation_id(f"window-{window_id}")
+                buffer_start += len(current_buffer) / (16000 * 2)
                 
                 logger.debug("Starting transcription...")
-                segments, info = await asyncio.to_thread(transcribe_wav_bytes, current_buffer)
+                language = languages.language_for(channel)
+                # Detect with the most accurate model, the smaller ones are unreliable detectors,
+                # until repeated failures show it does not help
+                if language is None and languages.detect_with_best_model(channel):
+                    level = quality.best_level
+                else:
+                    level = quality.level
+                initial_prompt = languages.initial_prompt_for(language)
+                # Waits for an in-flight partial caption decode and holds partials off until done
+                async with asr_lock:
+                    started = time.perf_counter()
+                    segments, info = await asyncio.to_thread(
+                        transcribe_wav_bytes, current_buffer, level, language, initial_prompt
+                    )
+                    decode_seconds = time.perf_counter() - started
+                    audio_seconds = len(current_buffer) / (16000 * 2)
+                    if REDECODE_LOW_CONFIDENCE and segments:
+                        redecode_seconds = quality.redecode_budget(level, audio_seconds, decode_seconds)
+                        if redecode_seconds > 0:
+                            segments = await asyncio.to_thread(
+                                redecode_low_confidence, current_buffer, segments,
+                                language or getattr(info, "language", None), initial_prompt, redecode_seconds
+                            )
+                if info and level == quality.level:  # Empty when decoding failed, which says nothing about speed
+                    quality.record(audio_seconds, decode_seconds)
+                languages.record(channel, language, info, segments, level == quality.best_level)
                 logger.debug(f"Transcription completed. Got {len(segments)} segments")
                 
+                if captions:
+                    # Commit the caption before the slower question generation
+                    captions.publish(
+                        "final", window_id, window_start, buffer_start,
+                        " ".join(seg.text.strip() for seg in segments)
+                    )
+                
                 if segments:
                     # Combine all segments into a single text
                     text = " ".join(seg.text for seg in segments)
@@ -79,58 +202,112 @@ async def transcribe_worker(queue: asyncio.Queue, chat_sender: TwitchChatSender)
                     # Only process non-empty transcriptions
                     if text.strip():
                         add_to_memory(text, speaker="streamer")
-                        context = get_recent_context()
-                        logger.info(f"Context for question:\n{context}")
-                        question = await asyncio.to_thread(generator.generate_question, context)
-                        logger.info(f"Generated question: {question}")
-                        add_bot_question(question)
-                        await chat_sender.send(question)
+                        # Only refill when the chat sender has drained the pool
+                        if len(candidate_pool) < QUESTION_BATCH_SIZE:
+                            context = get_recent_context()
+                            logger.info(f"Context for question:\n{context}")
+                            with span("llm.generate", count=QUESTION_BATCH_SIZE):
+                                questions = await asyncio.to_thread(
+                                    generator.generate_questions, context, QUESTION_BATCH_SIZE
+                                )
+                            logger.info(f"Generated questions: {questions}")
+                            candidate_pool.add(questions, f"window-{window_id}")
+                        else:
+                            logger.info(f"Candidate pool has {len(candidate_pool)} messages, skipping generation")
             else:
                 logger.debug(f"Waiting for more data. Current buffer: {len(buffer)} bytes, min required: {min_buffer_size} bytes")
         except Exception as e:
             logger.error(f"Error in transcribe_worker: {str(e)}", exc_info=True)
 
-def transcribe_wav_bytes(pcm_bytes: bytes) -> tuple[list, dict]:
+def transcribe_wav_bytes(pcm_bytes: bytes, level: QualityLevel | None = None,
+                         language: str | None = None, initial_prompt: str | None = None) -> tuple[list, dict]:
     """Transcribe WAV audio bytes to text.
     
     Args:
         pcm_bytes: Raw PCM audio data
+        level: Quality level to decode with, defaults to the controller's current level
+        language: Language code, or None to let Whisper detect it
+        initial_prompt: Vocabulary hints for the decoder
         
     Returns:
         Tuple of (segments, info) from Whisper
     """
+    level = level or quality.level
+    model = quality.model_for(level)
     try:
         # Build WAV in memory from raw PCM
-        bio = io.BytesIO()
-        with wave.open(bio, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 16-bit samples
-            wf.setframerate(16000)
-            wf.writeframes(pcm_bytes)
-        wav_data = bio.getvalue()
+        with span("wav.build", pcm_bytes=len(pcm_bytes)):
+            bio = io.BytesIO()
+            with wave.open(bio, 'wb') as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)  # 16-bit samples
+                wf.setframerate(16000)
+                wf.writeframes(pcm_bytes)
+            wav_data = bio.getvalue()
         
         logger.debug(f"Created WAV file of size: {len(wav_data)} bytes")
         
         # Decode with faster-whisper from BytesIO
         audio_buffer = io.BytesIO(wav_data)
         logger.debug("Starting Whisper transcription...")
-        segments, info = model.transcribe(
-            audio_buffer,
-            language="es",
-            vad_filter=True,
-            vad_parameters=dict(
-                min_silence_duration_ms=500,  # Minimum silence duration to consider a segment
-                speech_pad_ms=100,  # Padding around speech segments
-            ),
-            beam_size=BEAM_SIZE,
-            best_of=BEST_OF,
-            temperature=TEMPERATURE,
-            condition_on_previous_text=CONDITION_ON_PREVIOUS,
-            initial_prompt=INITIAL_PROMPT
-        )
+        with span("whisper.transcribe", audio_seconds=len(pcm_bytes) / (16000 * 2), model=level.model_name):
+            segments, info = model.transcribe(
+                audio_buffer,
+                language=language,
+                vad_filter=True,
+                vad_parameters=dict(
+                    min_silence_duration_ms=500,  # Minimum silence duration to consider a segment
+                    speech_pad_ms=100,  # Padding around speech segments
+                ),
+                beam_size=level.beam_size,
+                best_of=level.best_of,
+                temperature=TEMPERATURE,
+                condition_on_previous_text=CONDITION_ON_PREVIOUS,
+                initial_prompt=initial_prompt
+            )
+            
+            # Segments are decoded lazily, so consuming them is where the work happens
+            decoded = list(segments)
         
         logger.debug(f"Whisper transcription completed. Info: {info}")
-        return list(segments), info
+        return decoded, info
     except Exception as e:
         logger.error(f"Error in transcribe_wav_bytes: {str(e)}", exc_info=True)
         return [], {}
+
+def redecode_low_confidence(pcm_bytes: bytes, segments: list, language: str | None = None,
+                            initial_prompt: str | None = None, time_budget: float = math.inf) -> list:
+    """Re-decode low-confidence segments with the most accurate model.
+    
+    Args:
+        pcm_bytes: Raw PCM audio data the segments were decoded from
+        segments: Segments from the current quality level
+        language: Language code of the window
+        initial_prompt: Vocabulary hints for the decoder
+        time_budget: Seconds after which remaining segments are kept as they are
+        
+    Returns:
+        The segments, with low-confidence ones replaced when the re-decode is more confident
+    """
+    deadline = time.perf_counter() + time_budget
+    result = []
+    for seg in segments:
+        if math.exp(seg.avg_logprob) >= MIN_CONFIDENCE or time.perf_counter() >= deadline:
+            result.append(seg)
+            continue
+        start = int(seg.start * 16000) * 2
+        end = int(seg.end * 16000) * 2
+        redecoded, _ = transcribe_wav_bytes(
+            pcm_bytes[start:end], level=quality.best_level,
+            language=language, initial_prompt=initial_prompt
+        )
+        if redecoded:
+            avg_logprob = sum(s.avg_logprob for s in redecoded) / len(redecoded)
+            if avg_logprob > seg.avg_logprob:
+                logger.debug(f"Re-decoded low-confidence segment: {seg.text!r}")
+                seg = seg._replace(
+                    text=" ".join(s.text.strip() for s in redecoded),
+                    avg_logprob=avg_logprob
+                )
+        result.append(seg)
+    return result